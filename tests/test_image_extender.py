@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Tests for rendering several monitor profiles in one call.
+
+**Author: Jonathan Delgado**
+
+"""
+#------------- Imports -------------#
+from pathlib import Path
+import sys
+import unittest
+from unittest import mock
+import numpy as np
+from PIL import Image
+#--- Custom imports ---#
+# Modules of the app import each other by name
+sys.path.insert(0, str(Path(__file__).parent.parent / 'wallweave'))
+import image_extender
+from image_extender import Resolution
+#------------- Fields -------------#
+# Largest mean difference per channel tolerated against a per-profile render
+TOLERANCE = 1
+
+#======================== Helpers ========================#
+def gradient(width, height):
+    """ A smooth test image, so resampling differences stay small. """
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    pixels = np.stack(np.broadcast_arrays(
+        x[None, :], y[:, None], (x[None, :] + y[:, None]) / 2
+    ), axis=-1)
+    return Image.fromarray(pixels.astype(np.uint8), 'RGB')
+
+
+def per_profile(img, monitor, **kwargs):
+    """ The paper by_matched_ratio_blur makes, at the profile's resolution. """
+    paper = image_extender.by_matched_ratio_blur(img, monitor, **kwargs)
+    return paper.resize((monitor.width, monitor.height), image_extender.SCALING)
+
+
+def mean_difference(a, b):
+    return np.abs(np.asarray(a, np.float32) - np.asarray(b, np.float32)).mean()
+
+
+#======================== Tests ========================#
+class TestMatchedRatioBlurProfiles(unittest.TestCase):
+
+    def test_passthrough_matches_per_profile_calls(self):
+        # One pixel short of the profile's width, by_matched_ratio_blur keeps it
+        img = gradient(1919, 1080)
+        monitors = [ Resolution(1920, 1080), Resolution(3840, 2160) ]
+        papers = image_extender.by_matched_ratio_blur_profiles(img, monitors)
+
+        for monitor, paper in zip(monitors, papers):
+            expected = image_extender.by_matched_ratio_blur(img, monitor)
+            self.assertEqual(paper.size, (1919, 1080))
+            self.assertTrue(np.array_equal(np.asarray(paper), np.asarray(expected)))
+
+
+    def test_extended_matches_per_profile_calls(self):
+        img = gradient(800, 600)
+        monitors = [
+            Resolution(1920, 1080), Resolution(3840, 2160),
+            Resolution(1366, 768), Resolution(2560, 1080),
+        ]
+        papers = image_extender.by_matched_ratio_blur_profiles(
+            img, monitors, blur_intensity=20
+        )
+
+        for monitor, paper in zip(monitors, papers):
+            self.assertEqual(paper.size, (monitor.width, monitor.height))
+            self.assertLess(
+                mean_difference(paper, per_profile(img, monitor, blur_intensity=20)),
+                TOLERANCE
+            )
+
+
+    def test_center_is_resized_from_the_original(self):
+        img = gradient(800, 600)
+        monitor = Resolution(5120, 2880)
+        paper, = image_extender.by_matched_ratio_blur_profiles(img, [monitor])
+
+        center_width = int(img.width * monitor.height / img.height)
+        x0 = (monitor.width - center_width) // 2
+        center = paper.crop((x0, 0, x0 + center_width, monitor.height))
+        expected = img.resize((center_width, monitor.height), image_extender.SCALING)
+        self.assertTrue(np.array_equal(np.asarray(center), np.asarray(expected)))
+
+
+    def test_one_blur_per_exact_aspect_ratio(self):
+        img = gradient(800, 600)
+        monitors = [
+            Resolution(1920, 1080), Resolution(2560, 1440), Resolution(3840, 2160),
+            Resolution(1366, 768), Resolution(3440, 1440),
+        ]
+        with mock.patch.object(
+                image_extender, 'gaussian_blur',
+                wraps=image_extender.gaussian_blur) as blur:
+            image_extender.by_matched_ratio_blur_profiles(img, monitors)
+        # 16:9, 683:384 and 43:18
+        self.assertEqual(blur.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Tests for staging originals into the local cache, using a slow filesystem stand-in.
+
+**Author: Jonathan Delgado**
+
+"""
+#------------- Imports -------------#
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+#--- Custom imports ---#
+# Modules of the app import each other by name
+sys.path.insert(0, str(Path(__file__).parent.parent / 'wallweave'))
+import staging_manager
+#------------- Fields -------------#
+# Time a copy from the stand-in for the synced folder takes
+COPY_DELAY = 0.05
+# The real copy, shutil itself is patched during the tests
+copyfile = shutil.copyfile
+
+#======================== Helpers ========================#
+def slow_copyfile(src, dst):
+    """ Stand-in for copying out of a synced folder that has to download first. """
+    time.sleep(COPY_DELAY)
+    return copyfile(src, dst)
+
+
+#======================== Tests ========================#
+class TestSourceStager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.papers = root / 'papers'
+        self.papers.mkdir()
+        self.cache = root / 'cache'
+        patcher = mock.patch.object(
+            staging_manager.shutil, 'copyfile', side_effect=slow_copyfile
+        )
+        self.copyfile = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+
+    def make_paper(self, name, size=100):
+        path = self.papers / name
+        path.write_bytes(os.urandom(size))
+        return path
+
+
+    def wait_until_staged(self, stager, src, timeout=2):
+        deadline = time.monotonic() + timeout
+        while str(src) not in stager.manifest_copy():
+            if time.monotonic() > deadline:
+                self.fail(f'{src} was never staged')
+            time.sleep(0.01)
+
+
+    def test_miss_then_hit(self):
+        stager = staging_manager.SourceStager(self.cache)
+        src = self.make_paper('a.jpg')
+
+        local = stager.local_path(src)
+        self.assertEqual(local.read_bytes(), src.read_bytes())
+        self.assertEqual(local.parent, self.cache)
+        self.assertEqual(stager.local_path(src), local)
+
+        stats = stager.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(self.copyfile.call_count, 1)
+
+
+    def test_restages_after_size_change(self):
+        stager = staging_manager.SourceStager(self.cache)
+        src = self.make_paper('a.jpg', size=100)
+        stager.local_path(src)
+
+        src.write_bytes(os.urandom(150))
+        local = stager.local_path(src)
+        self.assertEqual(local.read_bytes(), src.read_bytes())
+        self.assertEqual(stager.stats()['misses'], 2)
+
+
+    def test_restages_after_mtime_change(self):
+        stager = staging_manager.SourceStager(self.cache)
+        src = self.make_paper('a.jpg')
+        stager.local_path(src)
+
+        # Same size, new contents and modification time
+        src.write_bytes(os.urandom(100))
+        stat = src.stat()
+        os.utime(src, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        local = stager.local_path(src)
+        self.assertEqual(local.read_bytes(), src.read_bytes())
+        self.assertEqual(stager.stats()['misses'], 2)
+
+
+    def test_evicts_least_recently_used_at_size_cap(self):
+        stager = staging_manager.SourceStager(self.cache, max_bytes=250)
+        first, second, third = (
+            self.make_paper(name) for name in ('a.jpg', 'b.jpg', 'c.jpg')
+        )
+        first_local = stager.local_path(first)
+        stager.local_path(second)
+        # Touch the first so the second is the least recently used
+        stager.local_path(first)
+        stager.local_path(third)
+
+        manifest = stager.manifest_copy()
+        self.assertNotIn(str(second), manifest)
+        self.assertIn(str(first), manifest)
+        self.assertTrue(first_local.exists())
+        self.assertLessEqual(stager.stats()['staged_bytes'], 250)
+        on_disk = sum(f.stat().st_size for f in self.cache.iterdir())
+        self.assertLessEqual(on_disk, 250)
+
+
+    def test_stall_counted_on_miss_but_not_hit(self):
+        stager = staging_manager.SourceStager(self.cache)
+        src = self.make_paper('a.jpg')
+
+        stager.local_path(src)
+        stalled = stager.stats()['stall_seconds']
+        self.assertGreaterEqual(stalled, COPY_DELAY)
+
+        stager.local_path(src)
+        self.assertEqual(stager.stats()['stall_seconds'], stalled)
+
+
+    def test_stall_counted_while_waiting_on_read_ahead(self):
+        stager = staging_manager.SourceStager(self.cache)
+        src = self.make_paper('a.jpg')
+
+        stager.read_ahead([src])
+        # Let read-ahead start its copy before the tick asks for the file
+        deadline = time.monotonic() + 2
+        while not self.copyfile.called:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+        stager.local_path(src)
+
+        stats = stager.stats()
+        self.assertEqual(
+            (stats['hits'], stats['waits'], stats['misses']), (0, 1, 0)
+        )
+        self.assertGreater(stats['stall_seconds'], 0)
+        self.assertEqual(self.copyfile.call_count, 1)
+
+
+    def test_read_ahead_avoids_stall(self):
+        stager = staging_manager.SourceStager(self.cache)
+        src = self.make_paper('a.jpg')
+
+        stager.read_ahead([src])
+        self.wait_until_staged(stager, src)
+        stager.local_path(src)
+
+        stats = stager.stats()
+        self.assertEqual(
+            (stats['hits'], stats['waits'], stats['misses']), (1, 0, 0)
+        )
+        self.assertEqual(stats['stall_seconds'], 0)
+
+
+    def test_restored_manifest_keeps_copies_and_removes_untracked(self):
+        stager = staging_manager.SourceStager(self.cache)
+        src = self.make_paper('a.jpg')
+        stager.local_path(src)
+        stray = self.cache / 'stray.jpg'
+        stray.write_bytes(b'left over from a crash')
+
+        restored = staging_manager.SourceStager(
+            self.cache, manifest=stager.manifest_copy()
+        )
+        self.assertFalse(stray.exists())
+        restored.local_path(src)
+        self.assertEqual(restored.stats()['hits'], 1)
+
+
+    def test_path_locks_are_released(self):
+        stager = staging_manager.SourceStager(self.cache)
+        stager.local_path(self.make_paper('a.jpg'))
+        self.assertEqual(stager.path_locks, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
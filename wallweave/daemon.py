@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""Headless render daemon serving wallpapers over a Unix-domain socket.
+
+Runs the extenders and paper selection without the menu bar or the Preferences window so rendering can be scripted, load-tested or run on machines without a display. Requests and responses are one JSON object per line:
+
+    {"cmd": "next", "width": 3440, "height": 1440, "playlist": "All"}
+    {"cmd": "render", "path": "/path/to/img.jpg", "width": 2560, "height": 1440}
+    {"cmd": "status"}
+    {"cmd": "stats"}
+    {"cmd": "refresh"}
+
+Render requests additionally accept "modifier", "blur_intensity" and "brightness". Refresh re-reads the playlists and drops the cached listings of their files.
+
+**Author: Jonathan Delgado**
+
+"""
+#------------- Imports -------------#
+import argparse
+from collections import OrderedDict, Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import random
+import socket
+import socketserver
+import threading
+import time
+from PIL import Image
+from pillow_heif import register_heif_opener # working with heic
+register_heif_opener() # necessary for HEIC files to work
+#--- Custom imports ---#
+import image_extender
+import paper_manager
+#------------- Fields -------------#
+PAPERS_PATH = Path.home() / 'Drive/Wallpapers'
+# Rendered papers are written inside of project directory
+OUTPUT_FOLDER = Path(__file__).parent.parent / 'temp' / 'daemon'
+SOCKET_PATH = '/tmp/wallweave.sock'
+# Memory budget of the decoded originals kept warm
+SOURCE_CACHE_BYTES = 2 * 1024**3
+# Seconds a playlist's file listing is reused before walking the folder again
+LISTING_TTL = 300
+# Largest width or height accepted for a render
+MAX_DIMENSION = 16384
+# Widest (and inverse narrowest) aspect ratio accepted, the canvas grows with it
+MAX_ASPECT_RATIO = 8
+
+#======================== Helpers ========================#
+class LRUCache(object):
+    """ Thread-safe least recently used cache keeping warm state between requests. Bounded by count and optionally by the total weight of its values, on_evict is called with every value dropped. """
+
+    def __init__(self, maxsize=32, max_weight=None, weigh=None, on_evict=None):
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigh = weigh or (lambda value: 0)
+        self.on_evict = on_evict
+        self.items = OrderedDict()
+        self.weights = {}
+        self.weight = 0
+        self.lock = threading.Lock()
+
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+
+    def put(self, key, value):
+        evicted = []
+        with self.lock:
+            if key in self.items:
+                self.weight -= self.weights[key]
+            self.items[key] = value
+            self.items.move_to_end(key)
+            self.weights[key] = self.weigh(value)
+            self.weight += self.weights[key]
+            # Always keep the newest value even if it alone is too heavy
+            while len(self.items) > 1 and (
+                    len(self.items) > self.maxsize
+                    or (self.max_weight is not None and self.weight > self.max_weight)):
+                old_key, old_value = self.items.popitem(last=False)
+                self.weight -= self.weights.pop(old_key)
+                evicted.append(old_value)
+
+        if self.on_evict is not None:
+            for old_value in evicted:
+                self.on_evict(old_value)
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SingleFlight(object):
+    """ Runs a computation once per key at a time, callers arriving while it runs wait on the first one's result. """
+
+    def __init__(self):
+        self.futures = {}
+        self.lock = threading.Lock()
+
+
+    def run(self, key, compute):
+        """ Returns the computed value and whether this caller computed it. """
+        with self.lock:
+            future = self.futures.get(key)
+            leader = future is None
+            if leader:
+                future = self.futures[key] = Future()
+        if not leader:
+            return future.result(), False
+
+        try:
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value, True
+        finally:
+            with self.lock:
+                del self.futures[key]
+
+
+class DaemonError(Exception):
+    """ Raised for malformed requests, reported back to the client. """
+    pass
+
+
+def check_resolution(monitor):
+    """ Rejects resolutions the extenders can't or shouldn't render. """
+    for dimension in monitor:
+        if not 0 < dimension <= MAX_DIMENSION:
+            raise DaemonError(
+                f'Width and height must be between 1 and {MAX_DIMENSION}.'
+            )
+    ratio = image_extender.aspect_ratio(monitor)
+    if not 1 / MAX_ASPECT_RATIO <= ratio <= MAX_ASPECT_RATIO:
+        raise DaemonError(
+            f'Aspect ratio must be between 1:{MAX_ASPECT_RATIO} '
+            f'and {MAX_ASPECT_RATIO}:1.'
+        )
+
+
+def img_bytes(img):
+    """ Approximate memory taken up by a decoded image. """
+    return img.width * img.height * len(img.getbands())
+
+
+def remove_paper(paper_path):
+    paper_path.unlink(missing_ok=True)
+
+
+#======================== Daemon ========================#
+class RenderDaemon(object):
+    def __init__(self, papers_path=PAPERS_PATH, output_folder=OUTPUT_FOLDER,
+            workers=4, cache_size=32, source_cache_bytes=SOURCE_CACHE_BYTES):
+        self.papers_path = Path(papers_path)
+        self.output_folder = Path(output_folder)
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        # Papers from a previous run are no longer tracked by any cache
+        for file in self.output_folder.iterdir():
+            if file.is_file(): file.unlink()
+        self.workers = workers
+        # Rendering happens on this pool, connections only wait on it
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        #--- Warm caches ---#
+        # Decoded originals keyed by path and modification time
+        self.sources = LRUCache(
+            cache_size, max_weight=source_cache_bytes, weigh=img_bytes
+        )
+        # Paths to rendered papers keyed by every input affecting the output,
+        # a paper is deleted once its key is dropped so the folder stays bounded
+        self.renders = LRUCache(cache_size * 4, on_evict=remove_paper)
+        # Concurrent requests for the same key share one decode or render
+        self.source_flights = SingleFlight()
+        self.render_flights = SingleFlight()
+        self.playlists = paper_manager.get_playlists(self.papers_path)
+        # Playlist name -> time listed and the files in it, walking the synced
+        # folder is too slow to repeat on every request
+        self.listings = {}
+        self.listings_lock = threading.Lock()
+        self.listing_flights = SingleFlight()
+        #--- Statistics ---#
+        self.started = time.time()
+        self.stats_lock = threading.Lock()
+        self.counts = Counter()
+        self.render_seconds = 0
+        self.in_flight = 0
+        self.last_paper = None
+
+
+    def count(self, *names):
+        with self.stats_lock:
+            self.counts.update(names)
+
+
+    #------------- Requests -------------#
+    def submit(self, request):
+        """ Handles a request, dispatching render work onto the worker pool. """
+        if not isinstance(request, dict):
+            self.count('errors')
+            return { 'ok': False, 'error': 'Requests must be JSON objects.' }
+        cmd = request.get('cmd')
+        if cmd in ('next', 'render'):
+            return self.pool.submit(self.handle, request).result()
+        return self.handle(request)
+
+
+    def handle(self, request):
+        """ Handles a single decoded request and returns the response. """
+        cmd = request.get('cmd')
+        handlers = {
+            'next': self.next,
+            'render': self.render,
+            'status': self.status,
+            'stats': self.stats,
+            'refresh': self.refresh,
+        }
+        if cmd not in handlers:
+            self.count('errors')
+            return { 'ok': False, 'error': f'Unknown command: {cmd}' }
+
+        self.count(f'cmd.{cmd}')
+        try:
+            response = handlers[cmd](request)
+        except (DaemonError, OSError) as e:
+            self.count('errors')
+            return { 'ok': False, 'error': str(e) }
+        except Exception as e:
+            # Never let a bad request take down the connection
+            self.count('errors')
+            return { 'ok': False, 'error': f'{type(e).__name__}: {e}' }
+
+        response['ok'] = True
+        return response
+
+
+    def next(self, request):
+        """ Selects a random paper from the playlist and renders it. """
+        playlist_name = request.get('playlist', 'All')
+        if playlist_name not in self.playlists:
+            raise DaemonError(f'Unknown playlist: {playlist_name}')
+
+        img_paths = self.playlist_img_paths(playlist_name)
+        if not img_paths:
+            raise DaemonError(f'Playlist is empty: {playlist_name}')
+        # Skip over files that are not images
+        for _ in range(10):
+            img_path = random.choice(img_paths)
+            try:
+                return self.render({ **request, 'path': str(img_path) })
+            except FileNotFoundError:
+                # The listing is out of date, walk the folder again
+                self.invalidate_listing(playlist_name)
+                img_paths = self.playlist_img_paths(playlist_name)
+                if not img_paths:
+                    raise DaemonError(f'Playlist is empty: {playlist_name}')
+            except IOError:
+                continue
+        raise DaemonError(f'No image found in playlist: {playlist_name}')
+
+
+    def playlist_img_paths(self, playlist_name):
+        """ Gets the files in the playlist, reusing the listing while it is fresh. """
+        with self.listings_lock:
+            listing = self.listings.get(playlist_name)
+        if listing is not None and time.monotonic() - listing[0] < LISTING_TTL:
+            return listing[1]
+
+        img_paths, _ = self.listing_flights.run(
+            playlist_name, lambda: self.list_playlist(playlist_name)
+        )
+        return img_paths
+
+
+    def list_playlist(self, playlist_name):
+        img_paths = paper_manager.img_paths(self.playlists[playlist_name]['path'])
+        with self.listings_lock:
+            self.listings[playlist_name] = (time.monotonic(), img_paths)
+        return img_paths
+
+
+    def invalidate_listing(self, playlist_name=None):
+        """ Drops the cached listing of the playlist, or of every playlist. """
+        with self.listings_lock:
+            if playlist_name is None:
+                self.listings.clear()
+            else:
+                self.listings.pop(playlist_name, None)
+
+
+    def render(self, request):
+        """ Renders the image at the path for the requested resolution. """
+        try:
+            img_path = Path(request['path'])
+            monitor = image_extender.Resolution(
+                int(request['width']), int(request['height'])
+            )
+            blur_intensity = int(request.get('blur_intensity', 30))
+            brightness = float(request.get('brightness', 0.8))
+        except (KeyError, TypeError, ValueError) as e:
+            raise DaemonError(f'Invalid render request: {e}')
+        check_resolution(monitor)
+
+        modifier_name = request.get('modifier', image_extender.DEFAULT_MODIFIER)
+        if modifier_name not in image_extender.MODIFIERS:
+            raise DaemonError(f'Unknown modifier: {modifier_name}')
+
+        mtime = img_path.stat().st_mtime_ns
+        key = (
+            str(img_path), mtime, monitor,
+            modifier_name, blur_intensity, brightness
+        )
+        paper_path = self.renders.get(key)
+        if paper_path is not None and paper_path.exists():
+            self.count('render.hit')
+            return self.paper_response(img_path, paper_path, cached=True)
+
+        paper_path, rendered = self.render_flights.run(
+            key, lambda: self.render_paper(key, monitor)
+        )
+        # Callers that waited on another request's render got it warm
+        self.count('render.miss' if rendered else 'render.shared')
+        return self.paper_response(img_path, paper_path, cached=not rendered)
+
+
+    def render_paper(self, key, monitor):
+        """ Renders and saves the paper for the cache key, only ever run once per key at a time. """
+        img_path, mtime, _, modifier_name, blur_intensity, brightness = key
+        # Another request may have finished this render since the lookup
+        paper_path = self.renders.get(key)
+        if paper_path is not None and paper_path.exists():
+            return paper_path
+
+        img = self.load_source(Path(img_path), mtime)
+        with self.stats_lock: self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            modifier = image_extender.MODIFIERS[modifier_name]
+            paper = modifier(
+                img, monitor,
+                blur_intensity=blur_intensity, brightness=brightness
+            )
+            digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+            paper_path = self.output_folder / f'{digest}.jpg'
+            # Clients are only ever handed complete files
+            partial = paper_path.with_name(paper_path.name + '.part')
+            paper.save(partial, format='JPEG', quality=100, subsampling=0)
+            os.replace(partial, paper_path)
+        finally:
+            with self.stats_lock:
+                self.in_flight -= 1
+                self.render_seconds += time.perf_counter() - start
+
+        self.renders.put(key, paper_path)
+        return paper_path
+
+
+    def load_source(self, img_path, mtime):
+        """ Gets the decoded original, reusing the warm copy if unchanged. """
+        key = (str(img_path), mtime)
+        img = self.sources.get(key)
+        if img is not None:
+            self.count('source.hit')
+            return img
+
+        img, decoded = self.source_flights.run(
+            key, lambda: self.decode_source(key)
+        )
+        self.count('source.miss' if decoded else 'source.shared')
+        return img
+
+
+    def decode_source(self, key):
+        """ Decodes the original for the cache key, only ever run once per key at a time. """
+        img = self.sources.get(key)
+        if img is not None:
+            return img
+        img = Image.open(key[0])
+        # Decode now so worker threads only ever read the pixels
+        img.load()
+        self.sources.put(key, img)
+        return img
+
+
+    def paper_response(self, img_path, paper_path, cached):
+        self.last_paper = str(paper_path)
+        return {
+            'source': str(img_path),
+            'paper': str(paper_path),
+            'cached': cached,
+        }
+
+
+    def refresh(self, request):
+        """ Re-reads the playlists and drops every cached listing. """
+        self.playlists = paper_manager.get_playlists(self.papers_path)
+        self.invalidate_listing()
+        return { 'playlists': sorted(self.playlists) }
+
+
+    def status(self, request):
+        return {
+            'uptime': time.time() - self.started,
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'playlists': sorted(self.playlists),
+            'modifiers': list(image_extender.MODIFIERS),
+            'last_paper': self.last_paper,
+        }
+
+
+    def stats(self, request):
+        with self.stats_lock:
+            counts = dict(self.counts)
+            render_seconds = self.render_seconds
+        renders = counts.get('render.miss', 0)
+        return {
+            'counts': counts,
+            'render_seconds': render_seconds,
+            'mean_render_seconds': render_seconds / renders if renders else 0,
+            'cached_sources': len(self.sources),
+            'cached_source_bytes': self.sources.weight,
+            'cached_renders': len(self.renders),
+        }
+
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+#======================== Server ========================#
+class RequestHandler(socketserver.StreamRequestHandler):
+    """ Reads newline-delimited JSON requests from a single connection. """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = self.server.render_daemon.submit(request)
+            except json.JSONDecodeError as e:
+                response = { 'ok': False, 'error': f'Invalid JSON: {e}' }
+            except Exception as e:
+                response = { 'ok': False, 'error': f'{type(e).__name__}: {e}' }
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon):
+        self.render_daemon = daemon
+        socket_path = Path(socket_path)
+        # Remove the stale socket from a previous run
+        if socket_path.exists():
+            socket_path.unlink()
+        super().__init__(str(socket_path), RequestHandler)
+
+
+def request(payload, socket_path=SOCKET_PATH):
+    """ Sends a single request to a running daemon and returns its response. """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(payload).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+#======================== Entry ========================#
+def main():
+    parser = argparse.ArgumentParser(description='Headless WallWeave renderer.')
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    parser.add_argument('--papers', default=PAPERS_PATH, type=Path)
+    parser.add_argument('--output', default=OUTPUT_FOLDER, type=Path)
+    parser.add_argument('--workers', default=4, type=int)
+    parser.add_argument('--cache-size', default=32, type=int)
+    parser.add_argument(
+        '--source-cache-mb', default=SOURCE_CACHE_BYTES // 1024**2, type=int
+    )
+    args = parser.parse_args()
+
+    daemon = RenderDaemon(
+        papers_path=args.papers, output_folder=args.output,
+        workers=args.workers, cache_size=args.cache_size,
+        source_cache_bytes=args.source_cache_mb * 1024**2,
+    )
+    with DaemonServer(args.socket, daemon) as server:
+        print(f'Listening on {args.socket} with {args.workers} workers...')
+        try:
+            server.serve_forever()
+        finally:
+            daemon.shutdown()
+            Path(args.socket).unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt as e:
+        print('Keyboard interrupt.')
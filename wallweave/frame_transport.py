@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Hands rendered frames from worker processes to the preview through shared memory.
+
+Frames are written straight into one of two slots of a shared memory block and the preview wraps the other slot as a QImage without copying. The writer only ever writes into the slot that isn't being shown and flips the front slot once the frame is complete, while per-slot locks keep a slot from being overwritten as it is being read, so frames never tear.
+
+**Author: Jonathan Delgado**
+
+"""
+#------------- Imports -------------#
+from collections import namedtuple
+from contextlib import contextmanager
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+#--- Custom imports ---#
+#------------- Fields -------------#
+# Frames are stored as RGBA8888, matching QImage.Format.Format_RGBA8888
+MODE = 'RGBA'
+CHANNELS = 4
+#--- Header layout ---#
+# int64 fields at the start of the block
+# WIDTH, HEIGHT and SLOT_SEQUENCE are per slot, SLOT_SEQUENCE being the
+# sequence number of the frame held in the slot
+FRONT, SEQUENCE, WIDTH, HEIGHT, SLOT_SEQUENCE = 0, 1, 2, 4, 6
+HEADER_FIELDS = 8
+HEADER_BYTES = HEADER_FIELDS * 8
+# A frame read from the front slot, data is a view into shared memory
+Frame = namedtuple('Frame', ['data', 'width', 'height', 'bytes_per_line', 'sequence'])
+
+#======================== Helpers ========================#
+def attach(name):
+    """ Attaches to an existing block without handing its lifetime to this process. """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no way to opt out of tracking
+        return shared_memory.SharedMemory(name=name)
+
+
+#======================== Transport ========================#
+class FrameBuffer(object):
+    """ Double buffered frames in shared memory. Create it in the process showing the frames and pass it to workers, e.g. as the initargs of a process pool started from the same multiprocessing context. """
+
+    def __init__(self, max_width, max_height, context=None):
+        self.max_width = max_width
+        self.max_height = max_height
+        self.shm = shared_memory.SharedMemory(create=True, size=self.size())
+        self.owner = True
+        # One lock per slot held while writing or reading it, plus one
+        # serializing writers so they agree on which slot is the back
+        context = context or multiprocessing.get_context()
+        self.slot_locks = (context.Lock(), context.Lock())
+        self.write_lock = context.Lock()
+        self.map_header()
+        self.header[:] = 0
+
+
+    def size(self):
+        return HEADER_BYTES + 2 * self.slot_bytes()
+
+
+    def slot_bytes(self):
+        return self.max_width * self.max_height * CHANNELS
+
+
+    def map_header(self):
+        self.header = np.ndarray(
+            (HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf
+        )
+
+
+    def __getstate__(self):
+        # Only the name is sent, workers attach to the same block
+        return {
+            'name': self.shm.name,
+            'max_width': self.max_width,
+            'max_height': self.max_height,
+            'slot_locks': self.slot_locks,
+            'write_lock': self.write_lock,
+        }
+
+
+    def __setstate__(self, state):
+        name = state.pop('name')
+        self.__dict__.update(state)
+        self.shm = attach(name)
+        self.owner = False
+        self.map_header()
+
+
+    def slot_view(self, slot, nbytes):
+        start = HEADER_BYTES + slot * self.slot_bytes()
+        return self.shm.buf[start:start + nbytes]
+
+
+    #------------- Writing -------------#
+    def write(self, img):
+        """ Writes the image into the back slot and makes it the front. Returns the frame's sequence number. """
+        if img.width > self.max_width or img.height > self.max_height:
+            raise ValueError(
+                f'Frame of {img.width} x {img.height} does not fit in '
+                f'{self.max_width} x {self.max_height}.'
+            )
+        if img.mode != MODE:
+            img = img.convert(MODE)
+        pixels = np.asarray(img)
+
+        with self.write_lock:
+            back = 1 - int(self.header[FRONT])
+            sequence = int(self.header[SEQUENCE]) + 1
+            with self.slot_locks[back]:
+                view = self.slot_view(back, img.width * img.height * CHANNELS)
+                # Array mapped onto the slot, assigning to it writes the
+                # pixels straight into shared memory
+                shared = np.ndarray(
+                    (img.height, img.width, CHANNELS), np.uint8, buffer=view
+                )
+                shared[:] = pixels
+                del shared
+                view.release()
+                self.header[WIDTH + back] = img.width
+                self.header[HEIGHT + back] = img.height
+                self.header[SLOT_SEQUENCE + back] = sequence
+            # Flip only once the frame is complete
+            self.header[FRONT] = back
+            self.header[SEQUENCE] = sequence
+            return sequence
+
+
+    #------------- Reading -------------#
+    @property
+    def sequence(self):
+        """ Number of frames written so far, used to check for new frames. The frame read from front() carries its own sequence, which may trail this one. """
+        return int(self.header[SEQUENCE])
+
+
+    @contextmanager
+    def front(self):
+        """ Locks the front slot and yields it as a Frame. The data is only valid inside the block, so convert it (e.g. QPixmap.fromImage) before leaving. """
+        slot = int(self.header[FRONT])
+        with self.slot_locks[slot]:
+            width = int(self.header[WIDTH + slot])
+            height = int(self.header[HEIGHT + slot])
+            sequence = int(self.header[SLOT_SEQUENCE + slot])
+            view = self.slot_view(slot, width * height * CHANNELS)
+            try:
+                yield Frame(
+                    view, width, height, width * CHANNELS, sequence
+                )
+            finally:
+                view.release()
+
+
+    def close(self):
+        """ Detaches from the block, removing it if this process created it. """
+        del self.header
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+#======================== Entry ========================#
+
+def main():
+    pass
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt as e:
+        print('Keyboard interrupt.')
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Retains the last rendered papers so stepping back through history is only an apply.
+
+**Author: Jonathan Delgado**
+
+"""
+#------------- Imports -------------#
+from pathlib import Path
+import shutil
+#--- Custom imports ---#
+#------------- Fields -------------#
+# Retained papers inside of project directory, outside of the temp folder
+RETAINED_FOLDER = Path(__file__).parent.parent / 'cache' / 'renders'
+# Most papers retained
+MAX_PAPERS = 50
+# Byte budget of the retained papers
+MAX_BYTES = 512 * 1024**2
+
+#======================== Store ========================#
+class RenderStore(object):
+    """ Bounded store of the last rendered papers with a cursor for stepping through them. A manifest saved from a previous run may be passed to keep its papers, anything else in the folder is removed. """
+
+    def __init__(self, folder=RETAINED_FOLDER, max_papers=MAX_PAPERS,
+            max_bytes=MAX_BYTES, manifest=None):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_papers = max_papers
+        self.max_bytes = max_bytes
+        # Oldest first, each with the original's path, the paper's path, the
+        # original's dimensions and the paper's size in bytes
+        self.entries = []
+        self.cursor = -1
+        # Retained papers are numbered so their names never collide
+        self.next_id = 0
+        self.load_manifest(manifest or {})
+
+
+    def add(self, img_path, paper_path, img_size):
+        """ Moves a freshly rendered paper into the store and points the cursor at it. Returns its entry. """
+        paper_path = Path(paper_path)
+        retained = self.folder / f'{self.next_id:06d}{paper_path.suffix}'
+        self.next_id += 1
+        shutil.move(paper_path, retained)
+
+        entry = {
+            'img_path': str(img_path),
+            'paper_path': str(retained),
+            'img_size': list(img_size),
+            'bytes': retained.stat().st_size,
+        }
+        self.entries.append(entry)
+        self.cursor = len(self.entries) - 1
+        self.evict()
+        return entry
+
+
+    def evict(self):
+        """ Removes the oldest papers until the store fits its count and byte budget, never the one at the cursor. """
+        total = sum(entry['bytes'] for entry in self.entries)
+        while len(self.entries) > 1 and (
+                len(self.entries) > self.max_papers or total > self.max_bytes):
+            # Always keep the paper being shown, even when it is the oldest
+            index = 1 if self.cursor == 0 else 0
+            entry = self.entries.pop(index)
+            Path(entry['paper_path']).unlink(missing_ok=True)
+            total -= entry['bytes']
+            if index < self.cursor:
+                self.cursor -= 1
+
+
+    #------------- Navigation -------------#
+    def current(self):
+        return self.entries[self.cursor] if self.entries else None
+
+
+    def has_previous(self):
+        return self.cursor > 0
+
+
+    def has_forward(self):
+        return self.cursor < len(self.entries) - 1
+
+
+    def previous(self):
+        """ Steps back, returns the entry to show or None if at the oldest. """
+        if not self.has_previous():
+            return None
+        self.cursor -= 1
+        return self.current()
+
+
+    def forward(self):
+        """ Steps forward, returns the entry to show or None if at the newest. """
+        if not self.has_forward():
+            return None
+        self.cursor += 1
+        return self.current()
+
+
+    #------------- Persistence -------------#
+    def manifest(self):
+        return {
+            'entries': list(self.entries),
+            'cursor': self.cursor,
+            'next_id': self.next_id,
+        }
+
+
+    def load_manifest(self, manifest):
+        """ Restores a manifest saved from a previous run, keeping the papers that are still around, and removes untracked files so the budget holds on disk. """
+        entries = manifest.get('entries', [])
+        cursor = manifest.get('cursor', len(entries) - 1)
+        current = entries[cursor] if 0 <= cursor < len(entries) else None
+
+        self.entries = [
+            entry for entry in entries if Path(entry['paper_path']).exists()
+        ]
+        self.cursor = (
+            self.entries.index(current) if current in self.entries
+            else len(self.entries) - 1
+        )
+        self.next_id = max(self.next_id, manifest.get('next_id', 0))
+        self.evict()
+
+        tracked = { Path(entry['paper_path']) for entry in self.entries }
+        for file in self.folder.iterdir():
+            if file.is_file() and file not in tracked:
+                file.unlink()
+
+
+#======================== Entry ========================#
+
+def main():
+    pass
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt as e:
+        print('Keyboard interrupt.')
@@ -5,14 +5,30 @@
 
 """
 #------------- Imports -------------#
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+import math
+import os
+import threading
 # ImageEnhance for controlling brightness
 from PIL import Image, ImageFilter, ImageDraw, ImageEnhance
 import numpy as np
 # import cv2
 #--- Custom imports ---#
 #------------- Fields -------------#
+# Stand-in for a screeninfo monitor or image when only the dimensions are known
+Resolution = namedtuple('Resolution', ['width', 'height'])
 # Scaling algorithm
 SCALING = Image.LANCZOS
+# Canvases with at least this many pixels are blurred in parallel strips
+PARALLEL_BLUR_PIXELS = 4_000_000
+# Number of strips blurred concurrently
+BLUR_WORKERS = os.cpu_count() or 1
+# Shared by every blur so concurrent renders, e.g. the daemon's workers, don't
+# each fan out to every core. Created on first use
+_blur_pool = None
+_blur_pool_lock = threading.Lock()
 #======================== Helpers ========================#
 def aspect_ratio(monitor):
     return monitor.width / monitor.height
@@ -40,6 +56,68 @@ def make_shadow_rect(img, rectangle):
     )
 
 
+def blur_margin(radius):
+    """ Number of rows on either side of a pixel that can affect it after Pillow's Gaussian blur, which is three box blurs of radius at most `radius`. """
+    return 3 * (math.ceil(radius) + 2)
+
+
+def blur_pool():
+    """ The thread pool shared by every parallel blur. """
+    global _blur_pool
+    with _blur_pool_lock:
+        if _blur_pool is None:
+            _blur_pool = ThreadPoolExecutor(
+                max_workers=BLUR_WORKERS, thread_name_prefix='blur'
+            )
+    return _blur_pool
+
+
+def _blur_strip(strip, radius):
+    # Module level so it can be sent to a process pool
+    return strip.filter(ImageFilter.GaussianBlur(radius))
+
+
+def parallel_gaussian_blur(img, radius, workers=None, executor=None):
+    """ Gaussian blur computed over horizontal strips concurrently. Each strip is cropped with enough overlap to cover the blur's reach so the stitched result has no seams. Pillow releases the GIL while filtering so the shared thread pool scales with cores, any other executor such as a process pool may be passed instead. """
+    workers = workers or BLUR_WORKERS
+    margin = blur_margin(radius)
+    # Strips thinner than their overlap would mostly blur duplicated rows
+    num_strips = max(1, min(workers, img.height // margin))
+    if radius <= 0 or num_strips == 1:
+        return img.filter(ImageFilter.GaussianBlur(radius))
+
+    # Rows each strip contributes to the result
+    bounds = [
+        (img.height * i // num_strips, img.height * (i + 1) // num_strips)
+        for i in range(num_strips)
+    ]
+    # The strips themselves extend past their bounds by the margin
+    crop_tops = [ max(0, top - margin) for top, _ in bounds ]
+    strips = [
+        img.crop((0, crop_top, img.width, min(img.height, bottom + margin)))
+        for crop_top, (_, bottom) in zip(crop_tops, bounds)
+    ]
+
+    executor = executor or blur_pool()
+    blurred = list(executor.map(_blur_strip, strips, [radius] * num_strips))
+
+    # Stitch the strips back together dropping the overlap
+    result = Image.new(img.mode, img.size)
+    for strip, crop_top, (top, bottom) in zip(blurred, crop_tops, bounds):
+        offset = top - crop_top
+        result.paste(
+            strip.crop((0, offset, img.width, offset + bottom - top)), (0, top)
+        )
+    return result
+
+
+def gaussian_blur(img, radius):
+    """ Blurs the canvas, in parallel for canvases large enough to benefit. """
+    if BLUR_WORKERS > 1 and img.width * img.height >= PARALLEL_BLUR_PIXELS:
+        return parallel_gaussian_blur(img, radius)
+    return img.filter(ImageFilter.GaussianBlur(radius))
+
+
 #======================== Modifiers ========================#
 def by_blur(img, monitor, blur_intensity=20, brightness=0.8):
     """ Extend the image to fit into screen space. """
@@ -91,7 +169,7 @@ def by_blur(img, monitor, blur_intensity=20, brightness=0.8):
     )
 
     # Blur the entire canvas
-    blurred = canvas.filter(ImageFilter.GaussianBlur(blur_intensity))
+    blurred = gaussian_blur(canvas, blur_intensity)
     
     # Dim it
     if brightness != 1:
@@ -172,7 +250,7 @@ def by_matched_ratio_blur(img, monitor, blur_intensity=20, brightness=0.8):
     )
 
     # Blur the entire canvas
-    blurred = canvas.filter(ImageFilter.GaussianBlur(blur_intensity))
+    blurred = gaussian_blur(canvas, blur_intensity)
     
     # Dim it
     if brightness != 1:
@@ -186,6 +264,77 @@ def by_matched_ratio_blur(img, monitor, blur_intensity=20, brightness=0.8):
     return blurred.convert('RGB')
 
 
+def matched_ratio_background(img, size, blur_intensity=20, brightness=0.8):
+    """ The blurred and dimmed background of by_matched_ratio_blur rendered directly at the given size. The blur radius is scaled with the size so it looks the same as at the image's own height. """
+    width, height = size
+    img_aspect_ratio = img.width / img.height
+    # Make the image the full width of the canvas
+    back_img_height = int(width / img_aspect_ratio)
+    back_img = img.resize((width, back_img_height), SCALING)
+    # Crop out the center portion that respects the aspect ratio
+    back_img = back_img.crop((
+        0, (back_img_height - height) // 2,
+        width, (back_img_height + height) // 2
+    ))
+
+    canvas = Image.new('RGBA', size, (0, 0, 0, 0))
+    canvas.paste(back_img, (0, 0))
+    blurred = gaussian_blur(canvas, blur_intensity * height / img.height)
+    if brightness != 1:
+        blurred = ImageEnhance.Brightness(blurred).enhance(brightness)
+    return blurred
+
+
+def by_matched_ratio_blur_profiles(img, monitors, blur_intensity=20, brightness=0.8):
+    """ Renders the image for a list of monitor profiles in one call, each paper at its profile's resolution. Profiles sharing an exact aspect ratio share one blurred background rendered at the group's largest size and scaled down for the rest, while the image in the center is resized from the original for every profile so it stays sharp. Images already wide enough are returned as-is, as by_matched_ratio_blur does. Returns the papers in the same order as the monitors. """
+    # Decode once for every profile
+    img.load()
+
+    # Group the profiles by their exact reduced aspect ratio so scaling the
+    # background never stretches it, keeping their original position
+    groups = {}
+    for i, monitor in enumerate(monitors):
+        ratio = Fraction(monitor.width, monitor.height)
+        groups.setdefault(ratio, []).append(i)
+
+    papers = [None] * len(monitors)
+    for indices in groups.values():
+        # Same test as by_matched_ratio_blur, it only depends on the ratio
+        canvas_width, _ = canvas_dimensions(img, monitors[indices[0]])
+        if (canvas_width - img.width) // 2 <= 0:
+            for i in indices:
+                papers[i] = img.convert('RGB')
+            continue
+
+        sizes = [ (monitors[i].width, monitors[i].height) for i in indices ]
+        largest = max(sizes, key=lambda size: size[1])
+        background = matched_ratio_background(
+            img, largest, blur_intensity=blur_intensity, brightness=brightness
+        )
+        for i, size in zip(indices, sizes):
+            if size == largest:
+                paper = background.copy()
+            else:
+                paper = background.resize(size, SCALING)
+            # Paste the center at the profile's own size
+            center_width = int(img.width * size[1] / img.height)
+            center = img.resize((center_width, size[1]), SCALING)
+            paper.paste(center, ((size[0] - center_width) // 2, 0))
+            papers[i] = paper.convert('RGB')
+
+    return papers
+
+
+#======================== Registry ========================#
+# Modifiers available to the menu bar and the daemon, keyed by display name
+MODIFIERS = {
+    'Blur (Matched Aspect Ratio)': by_matched_ratio_blur,
+    'Blur': by_blur,
+    # 'Mirror': by_mirror,
+}
+DEFAULT_MODIFIER = 'Blur (Matched Aspect Ratio)'
+
+
 #======================== Entry ========================#
 
 def main():
@@ -5,6 +5,8 @@
 
 """
 #------------- Imports -------------#
+from pathlib import Path
+import random
 import subprocess
 #--- Custom imports ---#
 #------------- Fields -------------#
@@ -24,6 +26,32 @@ END"""
     subprocess.run(script, shell=True)
 
 
+#======================== Selection ========================#
+def get_playlists(papers_path):
+    """ Get all available folders with images, plus an 'All' playlist. """
+    papers_path = Path(papers_path)
+    playlists = {
+        f.name: {
+            'name': f.name,
+            'path': f
+        }
+        for f in papers_path.iterdir()
+        if not f.is_file()
+    }
+    playlists.update({'All': {'name': 'All', 'path': papers_path}})
+    return playlists
+
+
+def img_paths(folder):
+    """ Get all files under the folder that could be converted to a wallpaper. """
+    return [ f for f in Path(folder).rglob('*.*') if f.is_file() ]
+
+
+def random_img_path(folder):
+    """ Get the path to a random image to be converted to a wallpaper. """
+    return random.choice(img_paths(folder))
+
+
 
 
 #======================== Entry ========================#
@@ -5,11 +5,11 @@
 
 """
 #------------- Imports -------------#
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import random
 import sys
 from PIL import Image, ImageFilter, ImageDraw
-from PIL.ImageQt import ImageQt # convert PIL images to Pixmaps
 from pillow_heif import register_heif_opener # working with heic
 register_heif_opener() # necessary for HEIC files to work
 import screeninfo
@@ -22,14 +22,39 @@ from PyQt6.QtWidgets import (
     QPushButton,
     QSlider,
 )
-from PyQt6.QtGui import QPixmap
-from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtCore import Qt, QTimer
 import PyQt6
 #--- Custom imports ---#
+import frame_transport
 import image_extender
 #------------- Fields -------------#
 __version__ = '0.0.0.0'
 PAPERS_PATH = Path.home() / 'Drive/Wallpapers'
+# Share of the monitor taken up by the preview
+PREVIEW_PERCENT = 0.8
+# How often to check for finished renders while any are in flight
+FRAME_POLL_MS = 30
+# Frame transport of the render worker, set once the worker starts
+frames = None
+
+#======================== Render Worker ========================#
+def init_render_worker(frame_buffer):
+    """ Attaches the worker process to the preview's frame transport. """
+    global frames
+    frames = frame_buffer
+
+
+def render_frame(img_path, monitor, size, blur_intensity, brightness):
+    """ Renders the preview in the worker process straight into shared memory. Returns the frame's sequence number. """
+    img = Image.open(img_path)
+    post = image_extender.by_blur(
+        img, monitor,
+        blur_intensity=blur_intensity, brightness=brightness,
+    )
+    return frames.write(post.resize(size, image_extender.SCALING))
+
+
 #======================== Main ========================#
 
 
@@ -38,6 +63,23 @@ class Preferences(QWidget):
     def __init__(self):
         super().__init__()
         self.monitor = screeninfo.get_monitors()[0]
+        self.preview_size = (
+            int(PREVIEW_PERCENT * self.monitor.width),
+            int(PREVIEW_PERCENT * self.monitor.height),
+        )
+        #--- Render worker ---#
+        # Frames come back through shared memory instead of being pickled
+        self.frames = frame_transport.FrameBuffer(*self.preview_size)
+        self.renderer = ProcessPoolExecutor(
+            max_workers=1,
+            initializer=init_render_worker, initargs=(self.frames,)
+        )
+        # Renders in flight, the UI thread never waits on them
+        self.pending = []
+        self.shown_sequence = 0
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setInterval(FRAME_POLL_MS)
+        self.frame_timer.timeout.connect(self.poll_frame)
 
         self.image_container = QLabel()
         # Setup the layout
@@ -122,21 +164,60 @@ class Preferences(QWidget):
         
 
     def update_img(self):
-        post = image_extender.by_blur(
-            self.img, self.monitor,
-            blur_intensity=self.blur_slider.value(),
-            brightness=self.brightness_slider.value()/100,
-        )
-        qimage = ImageQt(post)
-        pix = PyQt6.QtGui.QPixmap.fromImage(qimage)
-        # pix = pix.scaledToHeight(int(0.8 * self.monitor.height))
-        percent = 0.8
-        img_width = int(percent * self.monitor.width)
-        img_height = int(percent * self.monitor.height)
-        pix = pix.scaled(img_width, img_height)
+        """ Queues a render of the preview, it is shown once the worker is done. """
+        monitor = image_extender.Resolution(self.monitor.width, self.monitor.height)
+        try:
+            future = self.renderer.submit(
+                render_frame, self.img_path, monitor, self.preview_size,
+                blur_intensity=self.blur_slider.value(),
+                brightness=self.brightness_slider.value()/100,
+            )
+        except RuntimeError as e:
+            # The worker died or is shutting down
+            self.report_error(e)
+            return
+        self.pending.append(future)
+        self.frame_timer.start()
+
+
+    def poll_frame(self):
+        """ Shows the newest frame and reports failed renders. """
+        for future in [ f for f in self.pending if f.done() ]:
+            self.pending.remove(future)
+            if future.exception() is not None:
+                self.report_error(future.exception())
+
+        if self.frames.sequence != self.shown_sequence:
+            self.show_frame()
+        if not self.pending:
+            self.frame_timer.stop()
+
+
+    def show_frame(self):
+        with self.frames.front() as frame:
+            # Wraps the shared memory without copying, only valid in this block
+            qimage = QImage(
+                frame.data, frame.width, frame.height, frame.bytes_per_line,
+                QImage.Format.Format_RGBA8888
+            )
+            pix = QPixmap.fromImage(qimage)
+            del qimage
+            self.shown_sequence = frame.sequence
         self.image_container.setPixmap(pix)
 
 
+    def report_error(self, error):
+        print(f'Failed to render {self.img_path}: {error}')
+        self.image_container.setText(f'Failed to render preview: {error}')
+
+
+    def closeEvent(self, event):
+        self.frame_timer.stop()
+        self.renderer.shutdown(cancel_futures=True)
+        self.frames.close()
+        super().closeEvent(event)
+
+
     def random_paper(self):
         """ Change to a random wallpaper and update the information on it. """
         # Path to the original image
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Persists a snapshot of the app's warm state so restarts resume instantly.
+
+**Author: Jonathan Delgado**
+
+"""
+#------------- Imports -------------#
+import json
+from pathlib import Path
+#--- Custom imports ---#
+#------------- Fields -------------#
+# Snapshot inside of project directory, outside of the temp folder
+SNAPSHOT_PATH = Path(__file__).parent.parent / 'snapshot.json'
+# Bumped whenever the layout of the snapshot changes
+SNAPSHOT_VERSION = 1
+
+#======================== Snapshot ========================#
+def save_snapshot(state, path=SNAPSHOT_PATH):
+    """ Writes the state to the snapshot, replacing the old one only once fully written. """
+    path = Path(path)
+    partial = path.with_name(path.name + '.part')
+    partial.write_text(json.dumps({ 'version': SNAPSHOT_VERSION, **state }))
+    partial.replace(path)
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """ Reads the snapshot, returns None if there is none or it can't be used. """
+    try:
+        state = json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(state, dict) or state.get('version') != SNAPSHOT_VERSION:
+        print('Ignoring outdated snapshot.')
+        return None
+    return state
+
+
+#======================== Entry ========================#
+
+def main():
+    state = load_snapshot()
+    print(json.dumps(state, indent=4))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt as e:
+        print('Keyboard interrupt.')
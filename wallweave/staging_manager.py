@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Stages originals from the cloud-synced papers folder into a local cache.
+
+Opening a file the sync client has evicted blocks on a download, so upcoming originals are read ahead into a size-capped local cache on a background thread and decodes are always served from the local copy.
+
+**Author: Jonathan Delgado**
+
+"""
+#------------- Imports -------------#
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+from pathlib import Path
+import queue
+import shutil
+import threading
+import time
+#--- Custom imports ---#
+#------------- Fields -------------#
+# Staged originals inside of project directory
+CACHE_FOLDER = Path(__file__).parent.parent / 'cache' / 'sources'
+# Size cap of the staging cache in bytes
+MAX_BYTES = 1024**3
+
+#======================== Stager ========================#
+class SourceStager(object):
+    """ Size-capped local copies of originals. A manifest saved from a previous run may be passed to keep its staged copies, anything else in the cache folder is removed. """
+
+    def __init__(self, cache_folder=CACHE_FOLDER, max_bytes=MAX_BYTES,
+            manifest=None):
+        self.cache_folder = Path(cache_folder)
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # Source path -> size and modification time of the staged copy, in
+        # least recently used order
+        self.manifest = OrderedDict()
+        self.lock = threading.Lock()
+        # Serializes copies of the same file between the caller and
+        # read-ahead, each with the number of threads using it
+        self.path_locks = {}
+        #--- Statistics ---#
+        self.hits = 0
+        # Staged by read-ahead, but only after waiting for its copy to finish
+        self.waits = 0
+        self.misses = 0
+        self.stall_seconds = 0
+
+        self.load_manifest(manifest or {})
+
+        #--- Read-ahead ---#
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.read_ahead_loop, daemon=True)
+        self.thread.start()
+
+
+    def local_file(self, src):
+        """ The path in the cache a source file is staged to. """
+        digest = hashlib.sha1(str(src).encode()).hexdigest()[:16]
+        return self.cache_folder / f'{digest}{Path(src).suffix.lower()}'
+
+
+    def is_fresh(self, src, stat):
+        """ Checks whether the staged copy still matches the source's size and modification time. """
+        entry = self.manifest.get(str(src))
+        if entry is None:
+            return False
+        if (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime_ns):
+            return False
+        local = Path(entry['local'])
+        return local.exists() and local.stat().st_size == stat.st_size
+
+
+    def load_manifest(self, manifest):
+        """ Restores a manifest saved from a previous run, keeping the entries whose staged copy is still around, and removes untracked files so the size cap holds on disk. """
+        with self.lock:
+            for src, entry in manifest.items():
+                if Path(entry['local']).exists():
+                    self.manifest[src] = entry
+            self.evict()
+
+            tracked = { Path(entry['local']) for entry in self.manifest.values() }
+            for file in self.cache_folder.iterdir():
+                if file.is_file() and file not in tracked:
+                    file.unlink()
+
+
+    def manifest_copy(self):
+        """ A copy of the manifest that is safe to serialize while read-ahead runs. """
+        with self.lock:
+            return dict(self.manifest)
+
+
+    @contextmanager
+    def path_lock(self, src):
+        """ Holds the lock of the source, dropping it once no thread uses it. Yields whether another thread, e.g. read-ahead, had to be waited on. """
+        key = str(src)
+        with self.lock:
+            entry = self.path_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            waited = not entry[0].acquire(blocking=False)
+            if waited:
+                entry[0].acquire()
+            try:
+                yield waited
+            finally:
+                entry[0].release()
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.path_locks[key]
+
+
+    def stage(self, src):
+        """ Copies the source into the cache if it isn't already staged. Returns the local path, whether it was already staged and whether another copy of it had to be waited on. """
+        src = Path(src)
+        with self.path_lock(src) as waited:
+            # Metadata only, does not force the sync client to download
+            stat = src.stat()
+            with self.lock:
+                if self.is_fresh(src, stat):
+                    self.manifest.move_to_end(str(src))
+                    return Path(self.manifest[str(src)]['local']), True, waited
+
+            local = self.local_file(src)
+            # Copy next to the destination first so a partial file is never served
+            partial = local.with_name(local.name + '.part')
+            shutil.copyfile(src, partial)
+            partial.replace(local)
+
+            with self.lock:
+                self.manifest[str(src)] = {
+                    'local': str(local),
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime_ns,
+                }
+                self.manifest.move_to_end(str(src))
+                self.evict()
+        return local, False, waited
+
+
+    def evict(self):
+        """ Removes the least recently used files until the cache fits its size cap. Expects the lock to be held. """
+        total = sum(entry['size'] for entry in self.manifest.values())
+        # Always keep the most recent file even if it alone exceeds the cap
+        while total > self.max_bytes and len(self.manifest) > 1:
+            _, entry = self.manifest.popitem(last=False)
+            Path(entry['local']).unlink(missing_ok=True)
+            total -= entry['size']
+
+
+    def local_path(self, src):
+        """ Gets the local copy of the source to decode from, staging it now if read-ahead didn't get to it. """
+        start = time.perf_counter()
+        local, hit, waited = self.stage(src)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            if not hit:
+                self.misses += 1
+            elif waited:
+                # Read-ahead was still copying it, still a stall
+                self.waits += 1
+            else:
+                self.hits += 1
+            if waited or not hit:
+                self.stall_seconds += elapsed
+        return local
+
+
+    #------------- Read-ahead -------------#
+    def read_ahead(self, paths):
+        """ Queues the sources to be staged in the background. """
+        for path in paths:
+            self.queue.put(path)
+
+
+    def read_ahead_loop(self):
+        while True:
+            path = self.queue.get()
+            try:
+                self.stage(path)
+            except OSError as e:
+                print(f'Failed to stage {path}: {e}')
+
+
+    #------------- Reporting -------------#
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'waits': self.waits,
+                'misses': self.misses,
+                'stall_seconds': self.stall_seconds,
+                'staged': len(self.manifest),
+                'staged_bytes': sum(e['size'] for e in self.manifest.values()),
+            }
+
+
+    def summary(self):
+        """ One line report of the cache's hits, waits on read-ahead, misses and stall time. """
+        stats = self.stats()
+        return (
+            f"Cache: {stats['hits']} hits, {stats['waits']} waits, "
+            f"{stats['misses']} misses, "
+            f"{stats['stall_seconds']:.1f}s stalled"
+        )
+
+
+#======================== Entry ========================#
+
+def main():
+    pass
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt as e:
+        print('Keyboard interrupt.')
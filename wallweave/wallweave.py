@@ -6,31 +6,38 @@
 """
 #------------- Imports -------------#
 from pathlib import Path
-import random
 import rumps # menu bar
 import subprocess
 from PIL import Image, ImageFilter, ImageDraw
 from pillow_heif import register_heif_opener # working with heic
 register_heif_opener() # necessary for HEIC files to work
 import screeninfo # getting monitor information
+from collections import deque
 from datetime import datetime # used for serializing temp paths
 import os
 os.nice(19) # Decrease the program's CPU priority
 #--- Custom imports ---#
+import history_manager
 import image_extender
 import paper_manager
+import settings_manager
+import staging_manager
 #------------- Fields -------------#
 __version__ = '0.0.0.3'
 PAPERS_PATH = Path.home() / 'Drive/Wallpapers'
 # temp folder inside of project directory
 TEMP_FOLDER = Path(__file__).parent.parent / 'temp'
+# Number of upcoming originals staged locally ahead of time
+READ_AHEAD = 3
 
 #======================== Helpers ========================#
-def clear_temp_folder():
-    """ Clears any files in the temp folder to avoid any accidentaly reusing. """
+def clear_temp_folder(keep=()):
+    """ Clears any files in the temp folder to avoid any accidentaly reusing. Files in keep are left in place. """
     print('Clearing temp folder...')
+    keep = { Path(path) for path in keep }
     for file in TEMP_FOLDER.iterdir():
-        file.unlink()
+        # Leave folders such as the daemon's output alone
+        if file.is_file() and file not in keep: file.unlink()
 
 
 def should_extend_img(img, monitor):
@@ -53,13 +60,34 @@ class WallWeave(object):
         self.playlists = self.get_playlists()
         self.modifiers = self.get_modifiers()
         self.blur_intensity = 30
+        self.delay = 605
         self.counter = 0
         self.history = []
+        # Warm state from the last run, empty on a first launch
+        snapshot = settings_manager.load_snapshot() or {}
+        # Originals selected ahead of time so they can be staged locally
+        self.upcoming = deque()
+        self.stager = staging_manager.SourceStager(
+            manifest=snapshot.get('staged')
+        )
+        # Rendered papers retained for stepping back and forth
+        self.store = history_manager.RenderStore(
+            manifest=snapshot.get('renders')
+        )
+        # Whether the paper shown was restored and the first tick should keep it
+        self.resumed = False
 
         #--- Initialization ---#
         self.update_monitor()
-        clear_temp_folder()
+        # Sliders are built from these values
+        self.blur_intensity = snapshot.get('blur_intensity', self.blur_intensity)
+        self.delay = snapshot.get('delay', self.delay)
+        keep = [snapshot['paper_path']] if snapshot.get('paper_path') else []
+        clear_temp_folder(keep=keep)
         self.set_up_menu()
+        if snapshot:
+            self.restore(snapshot)
+        rumps.events.before_quit.register(self.save_snapshot)
 
 
     def update_monitor(self):
@@ -69,26 +97,13 @@ class WallWeave(object):
 
     def get_playlists(self):
         """ Get all available folders with images. """
-        playlists = {
-            f.name: {
-                'name': f.name,
-                'path': f
-            }
-            for f in PAPERS_PATH.iterdir()
-            if not f.is_file()
-        }
-        playlists.update({'All': {'name': 'All', 'path': PAPERS_PATH}})
-        return playlists
+        return paper_manager.get_playlists(PAPERS_PATH)
 
 
     def get_modifiers(self):
         """ Get all available modifiers for images. """
-        self.default_modifier = 'Blur (Matched Aspect Ratio)'
-        return {
-            'Blur (Matched Aspect Ratio)': image_extender.by_matched_ratio_blur,
-            'Blur': image_extender.by_blur,
-            # 'Mirror': image_extender.by_mirror,
-        }
+        self.default_modifier = image_extender.DEFAULT_MODIFIER
+        return dict(image_extender.MODIFIERS)
 
 
     def update_counter(self):
@@ -118,9 +133,8 @@ class WallWeave(object):
         #--- Delay Slider ---#
         slider_dimensions = (200, 30)
         # Slider for adjusting time delay of papers
-        timer_default = 605
         self.delay_slider = rumps.SliderMenuItem(
-            value=timer_default, min_value=5, max_value=605,
+            value=self.delay, min_value=5, max_value=605,
             dimensions=slider_dimensions, callback=self.on_slide
         )
         self.delay_slider._slider.setNumberOfTickMarks_(11)
@@ -131,7 +145,7 @@ class WallWeave(object):
         )
 
         # Make the wallpaper change timer
-        self.make_timer(timer_default)
+        self.make_timer(self.delay)
 
         #--- Blur Intensity Slider ---#
         # Slider for intensity of the blurring effect
@@ -152,6 +166,14 @@ class WallWeave(object):
             title='Next', callback=self.on_tick
         )
 
+        #--- History Navigation ---#
+        self.previous_button = rumps.MenuItem(
+            title='Previous', callback=self.on_previous
+        )
+        self.forward_button = rumps.MenuItem(
+            title='Forward', callback=self.on_forward
+        )
+
         #--- Pause ---#
         self.toggle_pause_button = rumps.MenuItem(
             title='Pause', callback=lambda _ : self.toggle_pause()
@@ -160,6 +182,7 @@ class WallWeave(object):
         #--- Paper information ---#
         self.img_name = rumps.MenuItem(title='Name')
         self.resolution = rumps.MenuItem(title='Resolution: ')
+        self.cache_info = rumps.MenuItem(title=self.stager.summary())
         self.open_paper_button = rumps.MenuItem(
             title='Open Image', callback=lambda sender: self.open_paper(self.img_path)
         )
@@ -201,6 +224,8 @@ class WallWeave(object):
         #--- Menu Generation ---#
         self.app.menu = [
             self.next_button,
+            self.previous_button,
+            self.forward_button,
             self.toggle_pause_button,
             self.slider_label,
             self.delay_slider,
@@ -210,6 +235,7 @@ class WallWeave(object):
             { 'Paper Information': [
                 self.img_name,
                 self.resolution,
+                self.cache_info,
                 None,
                 ],
             },
@@ -238,9 +264,9 @@ class WallWeave(object):
 
 
     def on_slide(self, sender):
-        value = int(sender.value)
-        self.slider_label.title = f'Delay: {value}s.'
-        self.make_timer(value)
+        self.delay = int(sender.value)
+        self.slider_label.title = f'Delay: {self.delay}s.'
+        self.make_timer(self.delay)
 
 
     def on_blur_slide(self, sender):
@@ -250,6 +276,11 @@ class WallWeave(object):
     
 
     def on_tick(self, sender):
+        if self.resumed and isinstance(sender, rumps.Timer):
+            # The timer fires as soon as it starts, keep the restored paper
+            self.resumed = False
+            return
+        self.resumed = False
         self.update_monitor()
         self.update_counter()
 
@@ -258,25 +289,67 @@ class WallWeave(object):
         paper_manager.change_all_papers(self.paper_path)
         self.img_name.title = self.img_path.name
         self.resolution.title = f'Resolution: {self.img.width} x {self.img.height}'
+        self.cache_info.title = self.stager.summary()
+        print(self.cache_info.title)
+        # The app is idle until the next tick, stage the upcoming papers now
+        self.stager.read_ahead(list(self.upcoming))
 
         self.counter += 1
+        self.save_snapshot()
+
+
+    def on_previous(self, sender):
+        entry = self.store.previous()
+        if entry is None:
+            print('No earlier paper retained.')
+            return
+        self.show_paper(entry)
+        self.save_snapshot()
+
+
+    def on_forward(self, sender):
+        entry = self.store.forward()
+        if entry is None:
+            print('Already at the latest paper.')
+            return
+        self.show_paper(entry)
+        self.save_snapshot()
+
+
+    def show_paper(self, entry):
+        """ Applies an already rendered paper, no decoding or modifier work involved. """
+        self.img_path = Path(entry['img_path'])
+        self.paper_path = Path(entry['paper_path'])
+        # Only the dimensions of the original are needed for the menu
+        self.img = image_extender.Resolution(*entry['img_size'])
+        print(f'Changing paper to: {self.img_path.name}')
+        paper_manager.change_all_papers(self.paper_path)
+        self.img_name.title = self.img_path.name
+        self.resolution.title = f'Resolution: {self.img.width} x {self.img.height}'
 
 
     def random_img_path(self):
         """ Get the path to a random image to be converted to a wallpaper. """
-        img_paths = [
-            f for f in self.playlist['path'].rglob('*.*') if f.is_file()
-        ]
-        return random.choice(img_paths)
+        return paper_manager.random_img_path(self.playlist['path'])
+
+
+    def next_img_path(self):
+        """ Get the next selected image and select more to stage ahead of time. Staging them waits until the paper is applied. """
+        img_path = self.upcoming.popleft() if self.upcoming else self.random_img_path()
+        self.upcoming.extend(
+            self.random_img_path()
+            for _ in range(READ_AHEAD - len(self.upcoming))
+        )
+        return img_path
 
 
     def random_paper(self):
         """ Change to a random wallpaper and update the information on it. """
         # Path to the original image
-        self.img_path = self.random_img_path()
-        # The original image
+        self.img_path = self.next_img_path()
+        # The original image, decoded from its local copy
         try:
-            self.img = Image.open(self.img_path)
+            self.img = Image.open(self.stager.local_path(self.img_path))
         except IOError:
             # File is not an image, try again
             self.random_paper()
@@ -287,6 +360,9 @@ class WallWeave(object):
         # Save the modified version to a temp directory
         self.paper_path = TEMP_FOLDER / f'{serial()}.jpg'
         self.paper.save(self.paper_path, quality=100, subsampling=0)
+        # Retain it outside of the temp folder for stepping back to it
+        entry = self.store.add(self.img_path, self.paper_path, self.img.size)
+        self.paper_path = Path(entry['paper_path'])
         self.update_history(self.img_path)
 
 
@@ -331,6 +407,8 @@ class WallWeave(object):
     def change_playlist(self, playlist_name):
         self.mark_playlist_state(playlist_name)
         self.playlist = self.playlists[playlist_name]
+        # Selections staged for the old playlist no longer apply
+        self.upcoming.clear()
         print(f'Playlist changed to: {playlist_name}')
 
 
@@ -358,6 +436,53 @@ class WallWeave(object):
         print(f'Modifier changed to: {modifier_name}')
 
 
+    def save_snapshot(self):
+        """ Persists the warm state to be restored on the next launch. """
+        state = {
+            'history': [ str(path) for path in self.history ],
+            'playlist': self.playlist['name'],
+            'modifier': self.modifier,
+            'delay': self.delay,
+            'blur_intensity': self.blur_intensity,
+            'upcoming': [ str(path) for path in self.upcoming ],
+            'staged': self.stager.manifest_copy(),
+            'renders': self.store.manifest(),
+        }
+        if hasattr(self, 'paper_path'):
+            state.update({
+                'img_path': str(self.img_path),
+                'paper_path': str(self.paper_path),
+                'img_size': [self.img.width, self.img.height],
+            })
+        try:
+            settings_manager.save_snapshot(state)
+        except OSError as e:
+            print(f'Failed to save snapshot: {e}')
+
+
+    def restore(self, snapshot):
+        """ Restores the warm state from a snapshot showing the last paper without rendering. """
+        print('Restoring snapshot...')
+        if snapshot.get('playlist') in self.playlists:
+            self.change_playlist(snapshot['playlist'])
+        if snapshot.get('modifier') in self.modifiers:
+            self.change_modifier(snapshot['modifier'])
+
+        upcoming = [ Path(path) for path in snapshot.get('upcoming', []) ]
+        self.upcoming.extend(upcoming)
+        self.stager.read_ahead(upcoming)
+
+        for path in snapshot.get('history', []):
+            self.update_history(Path(path))
+
+        paper_path = snapshot.get('paper_path')
+        if not paper_path or not Path(paper_path).exists():
+            return
+        # The snapshot records the last paper the same way the store does
+        self.show_paper(snapshot)
+        self.resumed = True
+
+
     def run(self):
         self.app.run()
 